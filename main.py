@@ -1,16 +1,360 @@
+import re
 import sys
-import requests
+import time
+import threading
+import itertools
+import http.client
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 import yt_dlp
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget,
     QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QLineEdit
 )
-from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt, QUrl
+from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtCore import Qt, QUrl, QObject, QRunnable, QThread, QThreadPool, Signal, Slot, QStandardPaths
 from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
+from PySide6.QtNetwork import QNetworkAccessManager, QNetworkDiskCache, QNetworkReply, QNetworkRequest
+
+
+class StreamProxyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.proxy.serve(self)
+
+    def do_HEAD(self):
+        self.server.proxy.serve(self, send_body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local HTTP server that feeds the player from parallel range requests: a single
+# googlevideo connection is throttled, so each upstream stream is fetched as
+# concurrent chunk requests and reassembled in order
+class StreamProxy:
+    # Audio streams are only a few MiB, so chunks must be small to fan out
+    CHUNK_SIZE = 1 << 20
+    MAX_WORKERS = 8
+    RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+    def __init__(self):
+        self._paths = {}  # upstream URL -> local path
+        self._tracks = {}  # local path -> (upstream URL, request headers, generation)
+        self._meta = {}  # local path -> (size, content type)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()  # playlist entries are registered concurrently
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), StreamProxyHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def add(self, url, headers, generation=0):
+        with self._lock:
+            path = self._paths.get(url)
+            if path is None:
+                path = self._paths[url] = f"/stream/{next(self._ids)}"
+            self._tracks[path] = (url, headers, generation)
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def release(self, generation):
+        # Forget streams registered for requests older than generation; their
+        # playlist has been replaced, so the player won't ask for them again
+        with self._lock:
+            for path, (url, _, track_generation) in list(self._tracks.items()):
+                if track_generation < generation:
+                    del self._tracks[path]
+                    del self._paths[url]
+                    self._meta.pop(path, None)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def serve(self, handler, send_body=True):
+        track = self._tracks.get(handler.path)
+        if track is None:
+            handler.send_error(404)
+            return
+        url, headers, _ = track
+        meta = self._meta.get(handler.path)
+        if meta is None:
+            try:
+                meta = self._probe(url, headers)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                print("Stream proxy failed to reach upstream:", e)
+                handler.send_error(502)
+                return
+            with self._lock:
+                if handler.path in self._tracks:
+                    self._meta[handler.path] = meta
+        size, content_type = meta
+
+        range_header = handler.headers.get("Range")
+        byte_range = self._parse_range(range_header, size) if range_header else None
+        start, end = byte_range or (0, size - 1)
+        if start > end:
+            handler.send_response(416)
+            handler.send_header("Content-Range", f"bytes */{size}")
+            handler.end_headers()
+            return
+
+        handler.send_response(206 if byte_range else 200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Accept-Ranges", "bytes")
+        handler.send_header("Content-Length", str(end - start + 1))
+        if byte_range:
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        handler.end_headers()
+        if not send_body:
+            return
+
+        # Keep up to MAX_WORKERS chunks in flight and write them back in order
+        chunks = ((pos, min(pos + self.CHUNK_SIZE, end + 1) - 1) for pos in range(start, end + 1, self.CHUNK_SIZE))
+        pending = deque()
+        try:
+            for first, last in chunks:
+                pending.append(self._executor.submit(self._fetch, url, headers, first, last))
+                if len(pending) >= self.MAX_WORKERS:
+                    handler.wfile.write(pending.popleft().result())
+            while pending:
+                handler.wfile.write(pending.popleft().result())
+        except (BrokenPipeError, ConnectionResetError, CancelledError):
+            pass  # the player seeked or stopped, or the proxy is closing; drop the rest
+        except (OSError, http.client.HTTPException) as e:
+            # Headers are already out, so all we can do is end the response
+            # early; the player re-requests from where it stopped
+            print("Stream proxy lost upstream:", e)
+            handler.close_connection = True
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @classmethod
+    def _parse_range(cls, header, size):
+        # Only a single "bytes=first-last" range is honoured; anything else is
+        # ignored and the whole stream is served, as HTTP allows
+        match = cls.RANGE_RE.fullmatch(header.strip())
+        if match is None or not any(match.groups()):
+            return None
+        first, last = match.groups()
+        if not first:
+            return size - min(int(last), size), size - 1  # suffix range: last N bytes
+        if last and int(last) < int(first):
+            return None  # syntactically invalid, so ignored rather than unsatisfiable
+        return int(first), min(int(last), size - 1) if last else size - 1
+
+    @staticmethod
+    def _probe(url, headers):
+        request = urllib.request.Request(url, headers={**headers, "Range": "bytes=0-0"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            if response.status != 206:
+                raise OSError(f"Upstream ignored the range request (HTTP {response.status})")
+            size = int(response.headers.get("Content-Range", "").rpartition("/")[2])
+            return size, response.headers.get_content_type()
+
+    @staticmethod
+    def _fetch(url, headers, first, last):
+        request = urllib.request.Request(url, headers={**headers, "Range": f"bytes={first}-{last}"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            # A 200 would be the whole stream, not the chunk asked for
+            if response.status != 206:
+                raise OSError(f"Upstream ignored the range request (HTTP {response.status})")
+            return response.read()
+
+
+class YTDLPWorker(QObject):
+    # Every signal carries the generation of the request it answers, so the
+    # window can drop results for requests it has since replaced
+    playlist_found = Signal(int, int)  # generation, number of tracks about to be resolved
+    track_resolved = Signal(int, int, str, str, str)  # generation, playlist index, stream URL, title, thumbnail URL
+    track_failed = Signal(int, int)  # generation, playlist index
+    failed = Signal(int, str)  # generation, error
+
+    # Signed googlevideo URLs expire, so cached extractions go stale
+    INFO_TTL = 5 * 60
+    INFO_CACHE_SIZE = 100
+    # Only what resolve() reads is cached, not the full formats/captions lists
+    INFO_FIELDS = ("_type", "entries", "url", "protocol", "http_headers", "title", "thumbnail", "thumbnails")
+    PLAYLIST_WORKERS = 4
+
+    def __init__(self, proxy):
+        super().__init__()
+        self.proxy = proxy
+        self._info_cache = {}  # url -> (monotonic timestamp, info), oldest first
+        self._cache_lock = threading.Lock()  # playlist entries are cached concurrently
+        self._local = threading.local()
+        self._sessions = []
+        self._executor = ThreadPoolExecutor(max_workers=self.PLAYLIST_WORKERS)
+        self._generation = 0  # latest request; older ones are abandoned
+        self._pending = []  # playlist entry futures of the latest request
+        self._pending_lock = threading.Lock()
+
+    def _session(self):
+        # One long-lived YoutubeDL per thread: building it loads every extractor
+        # and sets up the HTTP opener, which is too slow to repeat per click,
+        # and a single instance is not safe to share between threads
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            ydl = self._local.ydl = yt_dlp.YoutubeDL({
+                # Prefer AAC-in-M4A: it is YouTube's native container and plays on every
+                # QtMultimedia backend without transcoding. Plain HTTPS formats come
+                # first since DASH fragments are throttled and only they can go
+                # through the stream proxy
+                "format": "bestaudio[ext=m4a][protocol^=https]/bestaudio[protocol^=https]/bestaudio[ext=m4a]/bestaudio/best",
+                "quiet": True,
+                "noplaylist": True,
+                # Playlists, channels and tabs only list their entries instead of
+                # resolving every one; single videos are unaffected
+                "extract_flat": "in_playlist",
+                # We pick a single URL, so parsing the DASH manifest is wasted work
+                "youtube_include_dash_manifest": False,
+            })
+            self._sessions.append(ydl)
+        return ydl
+
+    def extract_info(self, url):
+        cached = self._info_cache.get(url)
+        if cached and time.monotonic() - cached[0] < self.INFO_TTL:
+            return cached[1]
+
+        info = self._session().extract_info(url, download=False)
+        info = {key: info[key] for key in self.INFO_FIELDS if key in info}
+
+        now = time.monotonic()
+        with self._cache_lock:
+            self._info_cache.pop(url, None)
+            self._info_cache[url] = (now, info)
+            # Oldest entries come first, so expired ones and any past the size
+            # cap can be dropped from the front
+            for key, (timestamp, _) in list(self._info_cache.items()):
+                if len(self._info_cache) <= self.INFO_CACHE_SIZE and now - timestamp < self.INFO_TTL:
+                    break
+                del self._info_cache[key]
+        return info
+
+    def cancel_pending(self, generation):
+        # Called from the GUI thread when a new request replaces the old one
+        with self._pending_lock:
+            self._generation = generation
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+
+    def cancel(self):
+        # Called from the GUI thread: drop playlist entries not yet started
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self._executor.shutdown()
+        for ydl in self._sessions:
+            ydl.close()
+        self._sessions.clear()
+
+    @Slot(int, str)
+    def resolve(self, generation, url):
+        if generation != self._generation:
+            return  # replaced while still queued
+        try:
+            info = self.extract_info(url)
+        except Exception as e:
+            self.failed.emit(generation, str(e))
+            return
+
+        if info.get("_type") != "playlist":
+            self.playlist_found.emit(generation, 1)
+            self._emit_track(generation, 0, info)
+            return
+
+        # Flat extraction only listed the entries: hand them to the pool and
+        # return, so a new request never waits behind a long playlist
+        entry_urls = [entry["url"] for entry in info.get("entries") or () if entry and entry.get("url")]
+        if not entry_urls:
+            self.failed.emit(generation, "Playlist is empty")
+            return
+        self.playlist_found.emit(generation, len(entry_urls))
+        with self._pending_lock:
+            if generation != self._generation:
+                return
+            try:
+                self._pending = [
+                    self._executor.submit(self._resolve_entry, generation, index, entry_url)
+                    for index, entry_url in enumerate(entry_urls)
+                ]
+            except RuntimeError:
+                pass  # the pool is shut down because the window is closing
+
+    def _resolve_entry(self, generation, index, url):
+        try:
+            info = self.extract_info(url)
+        except Exception as e:
+            print("Failed to resolve playlist entry:", url, e)
+            self.track_failed.emit(generation, index)
+            return
+        self._emit_track(generation, index, info)
+
+    def _emit_track(self, generation, index, info):
+        audio_url = info.get("url")  # direct stream URL
+        if not audio_url:
+            self.track_failed.emit(generation, index)
+            return
+        if info.get("protocol") in ("http", "https"):
+            # Play through the local proxy so playback isn't bound to one throttled connection
+            audio_url = self.proxy.add(audio_url, info.get("http_headers") or {}, generation)
+        self.track_resolved.emit(generation, index, audio_url, info.get("title", "YouTube Audio"), self.pick_thumbnail(info))
+
+    @staticmethod
+    def pick_thumbnail(info):
+        # info["thumbnail"] is usually maxresdefault; the smallest one that
+        # still fills the 200px album art is a fraction of the bytes
+        thumbnails = [
+            t for t in info.get("thumbnails") or ()
+            if t.get("url") and (t.get("width") or 0) >= 200
+        ]
+        if thumbnails:
+            return min(thumbnails, key=lambda t: t["width"])["url"]
+        return info.get("thumbnail") or ""
+
+
+class ThumbnailSignals(QObject):
+    decoded = Signal(str, QImage)  # thumbnail URL, scaled image
+
+
+# Decodes and scales album art on the global thread pool; QImage, unlike
+# QPixmap, is safe to build outside the GUI thread
+class ThumbnailDecoder(QRunnable):
+    def __init__(self, thumbnail_url, data):
+        super().__init__()
+        self.thumbnail_url = thumbnail_url
+        self.data = data
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        image = QImage.fromData(self.data)
+        if not image.isNull():
+            image = image.scaled(200, 200, Qt.KeepAspectRatio, Qt.FastTransformation)
+        self.signals.decoded.emit(self.thumbnail_url, image)
 
 
 class MusicPlayer(QMainWindow):
+    resolve_requested = Signal(int, str)  # generation, URL
+    PIXMAP_CACHE_SIZE = 32  # decoded album art kept in memory; the disk cache holds the rest
+
+    # Shared album art placeholder; a QPixmap can't exist before the
+    # QApplication, so it is built by the first window instead of at import
+    _placeholder = None
+
+    @classmethod
+    def placeholder(cls):
+        if cls._placeholder is None:
+            cls._placeholder = QPixmap(200, 200)
+            cls._placeholder.fill(Qt.darkGray)
+        return cls._placeholder
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Qt Music Player")
@@ -24,9 +368,7 @@ class MusicPlayer(QMainWindow):
         # Album art placeholder
         self.album_label = QLabel()
         self.album_label.setAlignment(Qt.AlignCenter)
-        pixmap = QPixmap(200, 200)
-        pixmap.fill(Qt.darkGray)
-        self.album_label.setPixmap(pixmap)
+        self.album_label.setPixmap(self.placeholder())
         layout.addWidget(self.album_label)
 
         # Song title
@@ -58,6 +400,15 @@ class MusicPlayer(QMainWindow):
         self.audio_output = QAudioOutput()
         self.player.setAudioOutput(self.audio_output)
 
+        # Album art is fetched asynchronously and cached on disk across sessions
+        self.nam = QNetworkAccessManager(self)
+        thumbnail_cache = QNetworkDiskCache(self)
+        cache_dir = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+        thumbnail_cache.setCacheDirectory(f"{cache_dir}/thumbnails")
+        self.nam.setCache(thumbnail_cache)
+        self.thumbnail_url = None  # album art wanted by the current track
+        self.pixmap_cache = OrderedDict()  # thumbnail URL -> scaled QPixmap, least recently used first
+
         # Button connections
         self.play_btn.clicked.connect(self.toggle_play)
         self.prev_btn.clicked.connect(self.prev_track)
@@ -65,51 +416,136 @@ class MusicPlayer(QMainWindow):
         self.open_btn.clicked.connect(self.open_file)
         self.yt_btn.clicked.connect(self.play_youtube)
 
+        # yt-dlp lives on its own thread so extraction never blocks the UI
+        self.ytdl_thread = QThread(self)
+        self.stream_proxy = StreamProxy()
+        self.ytdl_worker = YTDLPWorker(self.stream_proxy)
+        self.ytdl_worker.moveToThread(self.ytdl_thread)
+        self.ytdl_thread.finished.connect(self.ytdl_worker.deleteLater)
+        self.resolve_requested.connect(self.ytdl_worker.resolve)
+        self.ytdl_worker.playlist_found.connect(self.on_playlist_found)
+        self.ytdl_worker.track_resolved.connect(self.on_track_resolved)
+        self.ytdl_worker.track_failed.connect(self.on_track_failed)
+        self.ytdl_worker.failed.connect(self.on_youtube_failed)
+        self.ytdl_thread.start()
+
         self.is_playing = False
-        self.playlist = []  # list of file paths or stream URLs
+        self.playlist = []  # (file path or stream URL, title, thumbnail URL); None while resolving
         self.current_index = -1
+        self.youtube_playlist = []  # playlist the worker is filling in; False marks failed entries
+        self.start_index = 0  # first entry of youtube_playlist not known to have failed
+        self.request_generation = 0  # bumped per YouTube request; older results are dropped
 
     def open_file(self):
         file, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", "Audio Files (*.mp3 *.wav *.m4a)")
         if file:
-            self.playlist = [file]
+            # A local file replaces any YouTube request still resolving
+            self.request_generation += 1
+            self.ytdl_worker.cancel_pending(self.request_generation)
+            self.yt_btn.setEnabled(True)
+            self.playlist = [(file, None, None)]
             self.current_index = 0
             self.load_track(file)
+            self.stream_proxy.release(self.request_generation)
 
     def play_youtube(self):
         url = self.url_input.text().strip()
         if not url:
             return
 
-        # Extract best audio + metadata with yt-dlp
-        ydl_opts = {"format": "bestaudio/best", "quiet": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            audio_url = info["url"]  # direct stream URL
-            title = info.get("title", "YouTube Audio")
-            thumbnail_url = info.get("thumbnail")
+        # Extract best audio + metadata on the worker thread, abandoning
+        # whatever is left of the previous request
+        self.request_generation += 1
+        self.ytdl_worker.cancel_pending(self.request_generation)
+        self.yt_btn.setEnabled(False)
+        self.song_label.setText("Resolving audio stream...")
+        self.resolve_requested.emit(self.request_generation, url)
 
-        self.playlist = [audio_url]
-        self.current_index = 0
-        self.load_track(audio_url, title, thumbnail_url)
+    def on_playlist_found(self, generation, count):
+        if generation != self.request_generation:
+            return
+        # The current playlist stays active until the new one can start
+        self.youtube_playlist = [None] * count
+        self.start_index = 0
+
+    def on_track_resolved(self, generation, index, audio_url, title, thumbnail_url):
+        if generation != self.request_generation:
+            return
+        self.youtube_playlist[index] = (audio_url, title, thumbnail_url)
+        self.try_start_playlist(generation)
+
+    def on_track_failed(self, generation, index):
+        if generation != self.request_generation:
+            return
+        self.youtube_playlist[index] = False
+        self.try_start_playlist(generation)
+
+    def try_start_playlist(self, generation):
+        if self.playlist is self.youtube_playlist:
+            return  # already switched over
+        # Entries resolve out of order; start on the first one that didn't
+        # fail, not on whichever happened to finish first
+        while self.start_index < len(self.youtube_playlist) and self.youtube_playlist[self.start_index] is False:
+            self.start_index += 1
+        if self.start_index == len(self.youtube_playlist):
+            self.on_youtube_failed(generation, "No playable audio stream")
+        elif self.youtube_playlist[self.start_index]:
+            self.yt_btn.setEnabled(True)
+            self.playlist = self.youtube_playlist
+            self.stream_proxy.release(generation)
+            self.current_index = self.start_index
+            self.load_track(*self.playlist[self.current_index])
+
+    def on_youtube_failed(self, generation, error):
+        if generation != self.request_generation:
+            return
+        self.yt_btn.setEnabled(True)
+        self.song_label.setText("Failed to load YouTube audio")
+        print("Failed to resolve YouTube URL:", error)
 
     def load_track(self, file_or_url, title=None, thumbnail_url=None):
-        url = QUrl(file_or_url) if "http" in file_or_url else QUrl.fromLocalFile(file_or_url)
+        is_remote = file_or_url.startswith(("http://", "https://"))
+        url = QUrl(file_or_url) if is_remote else QUrl.fromLocalFile(file_or_url)
         self.player.setSource(url)
-        self.song_label.setText(title if title else file_or_url.split("/")[-1])
+        self.song_label.setText(title if title else Path(file_or_url).name)
         self.play_btn.setText("▶️")
         self.is_playing = False
 
         # Load album art if available
-        if thumbnail_url:
-            try:
-                img_data = requests.get(thumbnail_url).content
-                pixmap = QPixmap()
-                pixmap.loadFromData(img_data)
-                scaled = pixmap.scaled(200, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                self.album_label.setPixmap(scaled)
-            except Exception as e:
-                print("Failed to load thumbnail:", e)
+        self.thumbnail_url = thumbnail_url
+        if not thumbnail_url:
+            self.album_label.setPixmap(self.placeholder())
+        elif thumbnail_url in self.pixmap_cache:
+            self.pixmap_cache.move_to_end(thumbnail_url)
+            self.album_label.setPixmap(self.pixmap_cache[thumbnail_url])
+        else:
+            request = QNetworkRequest(QUrl(thumbnail_url))
+            request.setAttribute(QNetworkRequest.CacheLoadControlAttribute, QNetworkRequest.PreferCache)
+            reply = self.nam.get(request)
+            reply.finished.connect(lambda: self.on_thumbnail_loaded(reply, thumbnail_url))
+
+    def on_thumbnail_loaded(self, reply, thumbnail_url):
+        reply.deleteLater()
+        if reply.error() != QNetworkReply.NoError:
+            print("Failed to load thumbnail:", reply.errorString())
+            return
+
+        decoder = ThumbnailDecoder(thumbnail_url, reply.readAll())
+        decoder.signals.decoded.connect(self.on_thumbnail_decoded)
+        QThreadPool.globalInstance().start(decoder)
+
+    def on_thumbnail_decoded(self, thumbnail_url, image):
+        if image.isNull():
+            print("Failed to decode thumbnail:", thumbnail_url)
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        self.pixmap_cache[thumbnail_url] = pixmap
+        self.pixmap_cache.move_to_end(thumbnail_url)
+        if len(self.pixmap_cache) > self.PIXMAP_CACHE_SIZE:
+            self.pixmap_cache.popitem(last=False)
+        if thumbnail_url == self.thumbnail_url:  # skip if a newer track has been loaded since
+            self.album_label.setPixmap(pixmap)
 
     def toggle_play(self):
         if self.current_index == -1:
@@ -125,14 +561,27 @@ class MusicPlayer(QMainWindow):
             self.is_playing = True
 
     def prev_track(self):
-        if self.playlist and self.current_index > 0:
-            self.current_index -= 1
-            self.load_track(self.playlist[self.current_index])
+        self.jump_to(range(self.current_index - 1, -1, -1))
 
     def next_track(self):
-        if self.playlist and self.current_index < len(self.playlist) - 1:
-            self.current_index += 1
-            self.load_track(self.playlist[self.current_index])
+        self.jump_to(range(self.current_index + 1, len(self.playlist)))
+
+    def jump_to(self, indices):
+        # Skip playlist entries that are still resolving or failed to resolve
+        for index in indices:
+            if self.playlist[index]:
+                self.current_index = index
+                self.load_track(*self.playlist[index])
+                return
+
+    def closeEvent(self, event):
+        self.ytdl_worker.cancel()
+        self.ytdl_thread.quit()
+        self.ytdl_thread.wait()
+        self.ytdl_worker.close()
+        self.player.stop()
+        self.stream_proxy.close()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
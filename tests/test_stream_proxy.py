@@ -0,0 +1,173 @@
+import http.client
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# main pulls in Qt; QtMultimedia also fails to load without its system audio libraries
+pytest.importorskip("PySide6.QtMultimedia", exc_type=ImportError)
+pytest.importorskip("yt_dlp")
+from main import StreamProxy  # noqa: E402
+
+# A little over 3 MiB, so a full read fans out over several proxy chunks
+DATA = bytes(range(256)) * 12289
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    # Serves DATA with single-range support; server.mode selects a failure
+    def do_GET(self):
+        mode = self.server.mode
+        if mode == "forbidden":
+            self.send_error(403)
+            return
+        if mode == "ignore-range":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(DATA)))
+            self.end_headers()
+            self.wfile.write(DATA)
+            return
+
+        first, last = (int(n) for n in self.headers["Range"].removeprefix("bytes=").split("-"))
+        if mode == "fail-after-first-chunk" and first > 0:
+            self.send_error(403)
+            return
+        self.send_response(206)
+        self.send_header("Content-Type", "audio/mp4")
+        self.send_header("Content-Range", f"bytes {first}-{last}/{len(DATA)}")
+        self.send_header("Content-Length", str(last - first + 1))
+        self.end_headers()
+        self.wfile.write(DATA[first:last + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    mode = None
+
+    def handle_error(self, request, client_address):
+        pass  # the proxy hangs up on bodies it rejects
+
+
+@pytest.fixture
+def upstream():
+    server = UpstreamServer(("127.0.0.1", 0), UpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy():
+    proxy = StreamProxy()
+    yield proxy
+    proxy.close()
+
+
+@pytest.fixture
+def stream_url(upstream, proxy):
+    return proxy.add(f"http://127.0.0.1:{upstream.server_address[1]}/audio", {"User-Agent": "test"})
+
+
+def get(url, method="GET", byte_range=None):
+    headers = {"Range": byte_range} if byte_range else {}
+    request = urllib.request.Request(url, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, b""
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=10-5000", (10, 99)),
+    ("bytes=100-", (100, 99)),  # unsatisfiable, answered with 416
+    ("bytes=50-10", None),
+    ("bytes=0-1,5-9", None),
+    ("bytes=-", None),
+    ("items=0-9", None),
+    ("garbage", None),
+])
+def test_parse_range(header, expected):
+    assert StreamProxy._parse_range(header, 100) == expected
+
+
+def test_serves_whole_stream(stream_url):
+    status, headers, body = get(stream_url)
+    assert status == 200
+    assert headers["Content-Length"] == str(len(DATA))
+    assert headers["Content-Type"] == "audio/mp4"
+    assert body == DATA
+
+
+def test_serves_byte_range(stream_url):
+    status, headers, body = get(stream_url, byte_range="bytes=1000-2099999")
+    assert status == 206
+    assert headers["Content-Range"] == f"bytes 1000-2099999/{len(DATA)}"
+    assert body == DATA[1000:2100000]
+
+
+def test_serves_suffix_range(stream_url):
+    status, _, body = get(stream_url, byte_range="bytes=-10")
+    assert status == 206
+    assert body == DATA[-10:]
+
+
+def test_unsatisfiable_range(stream_url):
+    status, headers, _ = get(stream_url, byte_range=f"bytes={len(DATA)}-")
+    assert status == 416
+    assert headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+@pytest.mark.parametrize("byte_range", ["bytes=0-1,5-9", "bytes=50-10", "garbage"])
+def test_ignores_invalid_range(stream_url, byte_range):
+    status, _, body = get(stream_url, byte_range=byte_range)
+    assert status == 200
+    assert body == DATA
+
+
+def test_head_sends_no_body(stream_url):
+    status, headers, body = get(stream_url, method="HEAD")
+    assert status == 200
+    assert headers["Content-Length"] == str(len(DATA))
+    assert body == b""
+
+
+def test_unknown_path(stream_url):
+    status, _, _ = get(stream_url.rpartition("/")[0] + "/missing")
+    assert status == 404
+
+
+@pytest.mark.parametrize("mode", ["forbidden", "ignore-range"])
+def test_upstream_failure_before_headers(upstream, stream_url, mode):
+    upstream.mode = mode
+    status, _, _ = get(stream_url)
+    assert status == 502
+
+
+def test_upstream_failure_mid_stream(upstream, stream_url):
+    upstream.mode = "fail-after-first-chunk"
+    with pytest.raises(http.client.IncompleteRead) as excinfo:
+        get(stream_url)
+    assert excinfo.value.partial == DATA[:StreamProxy.CHUNK_SIZE]
+
+
+def test_add_reuses_path_for_same_url(upstream, proxy, stream_url):
+    assert proxy.add(f"http://127.0.0.1:{upstream.server_address[1]}/audio", {}) == stream_url
+
+
+def test_release_forgets_older_generations(upstream, proxy):
+    base = f"http://127.0.0.1:{upstream.server_address[1]}"
+    old_url = proxy.add(f"{base}/old", {}, generation=1)
+    new_url = proxy.add(f"{base}/new", {}, generation=2)
+    proxy.release(2)
+    assert get(old_url)[0] == 404
+    assert get(new_url)[0] == 200